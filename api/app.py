@@ -1,18 +1,82 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from datetime import datetime, timedelta
+from contextlib import contextmanager
 import sqlite3
 import hashlib
 import json
 import os
+import queue
+import threading
+import time
 from typing import Dict, List, Set
 
 app = Flask(__name__)
 CORS(app)
 
+DB_PATH = '/storage/database/js_monitor.db'
+POOL_SIZE = 8
+
+# Reader connections are opened lazily; None marks a slot not yet connected
+_pool = queue.Queue(maxsize=POOL_SIZE)
+for _ in range(POOL_SIZE):
+    _pool.put(None)
+
+# SQLite allows a single writer, so all writes share one connection
+_writer = None
+_writer_lock = threading.Lock()
+
+# Per-domain stats cache: domain -> (monotonic timestamp, stats dict)
+STATS_TTL = 10  # seconds
+_stats_cache = {}
+_stats_lock = threading.Lock()
+
+# WAL mode persists in the database file, the rest are per-connection
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-65536',  # 64 MB
+    'PRAGMA cache_spill=OFF',
+    'PRAGMA mmap_size=268435456',  # 256 MB
+    'PRAGMA wal_autocheckpoint=1000',
+)
+
+def _apply_pragmas(conn):
+    """Tune a connection for write throughput and concurrent readers"""
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+
+def _connect():
+    """Open a persistent connection tuned for concurrent access"""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+    _apply_pragmas(conn)
+    return conn
+
+@contextmanager
+def get_conn(write=False):
+    """Borrow a pooled connection (the shared writer if write=True)"""
+    global _writer
+    
+    if write:
+        with _writer_lock:
+            if _writer is None:
+                _writer = _connect()
+            yield _writer
+        return
+    
+    conn = _pool.get()
+    try:
+        if conn is None:
+            conn = _connect()
+        yield conn
+    finally:
+        _pool.put(conn)
+
 def init_db():
     """Initialize database with tables for JS file tracking"""
-    conn = sqlite3.connect('/storage/database/js_monitor.db')
+    conn = sqlite3.connect(DB_PATH)
+    _apply_pragmas(conn)
     c = conn.cursor()
     
     # Table for tracking discovered JS files
@@ -45,7 +109,29 @@ def init_db():
                   content_hash TEXT NOT NULL,
                   snapshot_date TIMESTAMP NOT NULL)''')
     
+    # Columns added after the initial schema
+    c.execute('PRAGMA table_info(js_files)')
+    columns = {row[1] for row in c.fetchall()}
+    if 'etag' not in columns:
+        c.execute('ALTER TABLE js_files ADD COLUMN etag TEXT')
+    if 'hash_algo' not in columns:
+        # Rows written before this column existed were hashed with SHA-256
+        c.execute("ALTER TABLE js_files ADD COLUMN hash_algo TEXT DEFAULT 'sha256'")
+    
+    # Indexes for the per-domain lookups done by the API endpoints
+    # (UNIQUE(domain, url) already covers lookups by URL)
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_jsfiles_domain_active
+                 ON js_files(domain, is_active)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_jsfiles_domain_firstseen
+                 ON js_files(domain, first_seen)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_alerts_lookup
+                 ON alerts(domain, file_url, alert_type, content_hash, alerted_at)''')
+    
     conn.commit()
+    
+    # Refresh planner statistics so the new indexes get picked up
+    c.execute('ANALYZE')
+    
     conn.close()
 
 @app.route('/api/check-new-files', methods=['POST'])
@@ -53,37 +139,66 @@ def check_new_files():
     """Check which files are new compared to historical data"""
     data = request.json
     domain = data['domain']
-    current_files = data['files']  # List of dicts: {url, filename, hash}
+    current_files = data['files']  # List of dicts: {url, filename, hash[, hash_algo, sha256]}
     
-    conn = sqlite3.connect('/storage/database/js_monitor.db')
-    c = conn.cursor()
-    
-    # Get known files for this domain
-    c.execute('''SELECT url, hash, filename FROM js_files 
-                 WHERE domain=? AND is_active=1''', (domain,))
-    known_files = {row[0]: {'hash': row[1], 'filename': row[2]} for row in c.fetchall()}
-    
-    new_files = []
-    modified_files = []
-    
-    for file in current_files:
-        url = file['url']
-        file_hash = file['hash']
+    with get_conn() as conn:
+        c = conn.cursor()
         
-        if url not in known_files:
-            # New file
-            new_files.append(file)
-        elif known_files[url]['hash'] != file_hash:
-            # Modified file
-            modified_files.append(file)
+        try:
+            # Diff inside SQLite instead of pulling every known file out
+            conn.execute('BEGIN')
+            c.execute('''CREATE TEMP TABLE current_files
+                         (url TEXT PRIMARY KEY, hash TEXT NOT NULL,
+                          hash_algo TEXT NOT NULL, sha256 TEXT)''')
+            c.executemany('INSERT OR REPLACE INTO current_files VALUES (?, ?, ?, ?)',
+                          [(f['url'], f['hash'], f.get('hash_algo', 'sha256'),
+                            f.get('sha256'))
+                           for f in current_files])
+            
+            # URLs not among the domain's active files
+            c.execute('''SELECT cur.url FROM current_files cur
+                         LEFT JOIN js_files j
+                         ON j.domain=? AND j.url=cur.url AND j.is_active=1
+                         WHERE j.url IS NULL''', (domain,))
+            new_urls = {row[0] for row in c.fetchall()}
+            
+            # Active files whose content hash changed. A stored SHA-256 hash
+            # is compared against the SHA-256 the extractor sends alongside a
+            # hash made with a newer algorithm; pairs that still can't be
+            # compared are reported as unverified instead of being dropped.
+            c.execute('''SELECT cur.url,
+                                CASE WHEN j.hash_algo = cur.hash_algo THEN j.hash != cur.hash
+                                     WHEN j.hash_algo = 'sha256' AND cur.sha256 IS NOT NULL
+                                     THEN j.hash != cur.sha256
+                                END
+                         FROM current_files cur
+                         JOIN js_files j
+                         ON j.domain=? AND j.url=cur.url AND j.is_active=1''', (domain,))
+            modified_urls = set()
+            unverified_urls = set()
+            for url, changed in c.fetchall():
+                if changed is None:
+                    unverified_urls.add(url)
+                elif changed:
+                    modified_urls.add(url)
+            
+            c.execute('''SELECT COUNT(*) FROM js_files 
+                         WHERE domain=? AND is_active=1''', (domain,))
+            total_known = c.fetchone()[0]
+        finally:
+            # Nothing to keep; rolling back also discards the scratch table
+            conn.rollback()
     
-    conn.close()
+    new_files = [f for f in current_files if f['url'] in new_urls]
+    modified_files = [f for f in current_files if f['url'] in modified_urls]
+    unverified_files = [f for f in current_files if f['url'] in unverified_urls]
     
     return jsonify({
         'new_files': new_files,
         'modified_files': modified_files,
+        'unverified_files': unverified_files,
         'total_current': len(current_files),
-        'total_known': len(known_files)
+        'total_known': total_known
     })
 
 @app.route('/api/register-files', methods=['POST'])
@@ -93,38 +208,40 @@ def register_files():
     domain = data['domain']
     files = data['files']
     
-    conn = sqlite3.connect('/storage/database/js_monitor.db')
-    c = conn.cursor()
     now = datetime.now()
+    rows = [(domain, f['url'], f['filename'], f['hash'], f.get('hash_algo', 'sha256'),
+             f.get('etag'), now, now)
+            for f in files]
     
-    # Mark all current files as inactive first
-    c.execute('UPDATE js_files SET is_active=0 WHERE domain=?', (domain,))
-    
-    for file in files:
-        url = file['url']
-        filename = file['filename']
-        file_hash = file['hash']
+    with get_conn(write=True) as conn:
+        c = conn.cursor()
         
-        # Check if file already exists
-        c.execute('''SELECT id FROM js_files WHERE domain=? AND url=?''', 
-                  (domain, url))
-        result = c.fetchone()
-        
-        if result:
-            # Update existing record
-            c.execute('''UPDATE js_files SET 
-                         hash=?, last_seen=?, is_active=1 
-                         WHERE id=?''',
-                      (file_hash, now, result[0]))
-        else:
-            # Insert new record
-            c.execute('''INSERT INTO js_files 
-                         (domain, url, filename, hash, first_seen, last_seen)
-                         VALUES (?, ?, ?, ?, ?, ?)''',
-                      (domain, url, filename, file_hash, now, now))
+        try:
+            # Single transaction so the whole batch costs one fsync
+            conn.execute('BEGIN')
+            
+            # Mark all current files as inactive first
+            c.execute('UPDATE js_files SET is_active=0 WHERE domain=?', (domain,))
+            
+            # Insert new files, refresh existing ones (UNIQUE(domain, url))
+            c.executemany('''INSERT INTO js_files 
+                             (domain, url, filename, hash, hash_algo, etag,
+                              first_seen, last_seen)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                             ON CONFLICT(domain, url) DO UPDATE SET
+                             hash=excluded.hash, hash_algo=excluded.hash_algo,
+                             etag=excluded.etag, last_seen=excluded.last_seen,
+                             is_active=1''',
+                          rows)
+            
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
     
-    conn.commit()
-    conn.close()
+    # Stats for this domain are stale now
+    with _stats_lock:
+        _stats_cache.pop(domain, None)
     
     return jsonify({'status': 'success', 'registered': len(files)})
 
@@ -137,20 +254,19 @@ def should_alert():
     content_hash = data['content_hash']
     alert_type = data.get('alert_type', 'new_file')
     
-    conn = sqlite3.connect('/storage/database/js_monitor.db')
-    c = conn.cursor()
-    
-    # Check if same alert was sent in last 7 days
-    cutoff = datetime.now() - timedelta(days=7)
-    c.execute('''SELECT COUNT(*) FROM alerts 
-                 WHERE domain=? AND file_url=? AND alert_type=? 
-                 AND content_hash=? AND alerted_at > ?''',
-              (domain, file_url, alert_type, content_hash, cutoff))
-    
-    count = c.fetchone()[0]
-    conn.close()
+    with get_conn() as conn:
+        c = conn.cursor()
+        
+        # Check if same alert was sent in last 7 days
+        cutoff = datetime.now() - timedelta(days=7)
+        c.execute('''SELECT 1 FROM alerts 
+                     WHERE domain=? AND file_url=? AND alert_type=? 
+                     AND content_hash=? AND alerted_at > ? LIMIT 1''',
+                  (domain, file_url, alert_type, content_hash, cutoff))
+        
+        alert = c.fetchone() is None
     
-    return jsonify({'should_alert': count == 0})
+    return jsonify({'should_alert': alert})
 
 @app.route('/api/record-alert', methods=['POST'])
 def record_alert():
@@ -161,50 +277,97 @@ def record_alert():
     alert_type = data['alert_type']
     content_hash = data['content_hash']
     
-    conn = sqlite3.connect('/storage/database/js_monitor.db')
-    c = conn.cursor()
+    with get_conn(write=True) as conn:
+        conn.execute('''INSERT INTO alerts 
+                        (domain, file_url, alert_type, content_hash, alerted_at)
+                        VALUES (?, ?, ?, ?, ?)''',
+                     (domain, file_url, alert_type, content_hash, datetime.now()))
     
-    c.execute('''INSERT INTO alerts 
-                 (domain, file_url, alert_type, content_hash, alerted_at)
-                 VALUES (?, ?, ?, ?, ?)''',
-              (domain, file_url, alert_type, content_hash, datetime.now()))
+    return jsonify({'status': 'success'})
+
+@app.route('/api/try-alert', methods=['POST'])
+def try_alert():
+    """Atomically check deduplication and record the alert in one call"""
+    data = request.json
+    domain = data['domain']
+    file_url = data['file_url']
+    content_hash = data['content_hash']
+    alert_type = data.get('alert_type', 'new_file')
     
-    conn.commit()
-    conn.close()
+    now = datetime.now()
+    cutoff = now - timedelta(days=7)
     
-    return jsonify({'status': 'success'})
+    with get_conn(write=True) as conn:
+        c = conn.cursor()
+        
+        try:
+            # Take the write lock up front so check + insert cannot race
+            conn.execute('BEGIN IMMEDIATE')
+            
+            # Check if same alert was sent in last 7 days
+            c.execute('''SELECT 1 FROM alerts 
+                         WHERE domain=? AND file_url=? AND alert_type=? 
+                         AND content_hash=? AND alerted_at > ? LIMIT 1''',
+                      (domain, file_url, alert_type, content_hash, cutoff))
+            alert = c.fetchone() is None
+            
+            if alert:
+                # Refresh the timestamp of an expired alert for the same content
+                c.execute('''INSERT INTO alerts 
+                             (domain, file_url, alert_type, content_hash, alerted_at)
+                             VALUES (?, ?, ?, ?, ?)
+                             ON CONFLICT(domain, file_url, alert_type, content_hash)
+                             DO UPDATE SET alerted_at=excluded.alerted_at''',
+                          (domain, file_url, alert_type, content_hash, now))
+            
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    
+    return jsonify({'should_alert': alert, 'recorded': alert})
 
 @app.route('/api/stats/<domain>', methods=['GET'])
 def get_stats(domain):
     """Get statistics for a domain"""
-    conn = sqlite3.connect('/storage/database/js_monitor.db')
-    c = conn.cursor()
-    
-    # Total files tracked
-    c.execute('''SELECT COUNT(*) FROM js_files WHERE domain=?''', (domain,))
-    total = c.fetchone()[0]
+    with _stats_lock:
+        cached = _stats_cache.get(domain)
+    if cached and time.monotonic() - cached[0] < STATS_TTL:
+        return jsonify(cached[1])
     
-    # Currently active files
-    c.execute('''SELECT COUNT(*) FROM js_files WHERE domain=? AND is_active=1''', 
-              (domain,))
-    active = c.fetchone()[0]
-    
-    # New files in last 24 hours
-    cutoff = datetime.now() - timedelta(days=1)
-    c.execute('''SELECT COUNT(*) FROM js_files 
-                 WHERE domain=? AND first_seen > ?''',
-              (domain, cutoff))
-    recent = c.fetchone()[0]
-    
-    conn.close()
+    with get_conn() as conn:
+        c = conn.cursor()
+        
+        # Total files tracked
+        c.execute('''SELECT COUNT(*) FROM js_files WHERE domain=?''', (domain,))
+        total = c.fetchone()[0]
+        
+        # Currently active files
+        c.execute('''SELECT COUNT(*) FROM js_files WHERE domain=? AND is_active=1''', 
+                  (domain,))
+        active = c.fetchone()[0]
+        
+        # New files in last 24 hours
+        cutoff = datetime.now() - timedelta(days=1)
+        c.execute('''SELECT COUNT(*) FROM js_files 
+                     WHERE domain=? AND first_seen > ?''',
+                  (domain, cutoff))
+        recent = c.fetchone()[0]
     
-    return jsonify({
+    stats = {
         'domain': domain,
         'total_files_tracked': total,
         'currently_active_files': active,
         'new_files_last_24h': recent
-    })
+    }
+    
+    with _stats_lock:
+        _stats_cache[domain] = (time.monotonic(), stats)
+    
+    return jsonify(stats)
 
 if __name__ == '__main__':
+    # Development server only; production runs under gunicorn (see Dockerfile)
     init_db()
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    app.run(host='0.0.0.0', port=5000,
+            debug=os.environ.get('FLASK_DEBUG') == '1', threaded=True)
@@ -2,14 +2,63 @@
 
 import requests
 import re
+import bisect
 import json
 from typing import Dict, List
 import sys
 
+# Patterns work on raw bytes; only reported snippets get decoded
+
+# Look for API endpoints
+_ENDPOINT_RES = tuple(re.compile(p) for p in (
+    rb'["\'](https?://[^"\']+?/api/[^"\']*?)["\']',
+    rb'["\'](/api/[^"\']*?)["\']',
+    rb'fetch\(["\']([^"\']+?)["\']',
+    rb'axios\.(?:get|post|put|delete)\(["\']([^"\']+?)["\']',
+    rb'\.ajax\([^)]*?url:\s*["\']([^"\']+?)["\']'
+))
+
+# Extract comments (potential information disclosure)
+_COMMENT_RES = tuple(re.compile(p, re.DOTALL | re.MULTILINE) for p in (
+    rb'//\s*(.*?)$',  # Single line comments
+    rb'/\*\*(.*?)\*/',  # JSDoc comments
+    rb'/\*!(.*?)\*/',  # Important comments
+))
+
+# Look for hardcoded credentials patterns
+_CREDENTIAL_RES = tuple(re.compile(p) for p in (
+    rb'["\'](eyJ[A-Za-z0-9_-]+\.eyJ[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+)["\']',  # JWT
+    rb'["\'](AKIA[0-9A-Z]{16})["\']',  # AWS Access Key
+    rb'["\']([0-9a-f]{40})["\']',  # SHA1 hash
+    rb'["\']([0-9a-f]{64})["\']',  # SHA256 hash
+))
+
+JS_CACHE_DIR = "/storage/js_cache"  # Bodies saved by extract_js.py, keyed by hash
+
+# Upper bounds on reported keyword and credential findings (capped
+# separately so keyword noise can't crowd out credentials); keeps the
+# analysis JSON small enough to hand on to the Slack sender. Totals are
+# still counted past the caps.
+MAX_KEYWORD_FINDINGS = 50
+MAX_CREDENTIAL_FINDINGS = 50
+
+def _text(data: bytes) -> str:
+    """Decode a reported snippet, tolerating invalid or truncated UTF-8"""
+    return data.decode('utf-8', 'replace')
+
 class JSAnalyzer:
     def __init__(self):
         self.sensitive_keywords = self.load_keywords()
         
+        # All keywords folded into one pattern so content is scanned once
+        # (longest first so overlapping keywords prefer the full match).
+        # No keywords means no sweep: an empty alternation matches everywhere.
+        keywords = sorted(self.sensitive_keywords, key=len, reverse=True)
+        self._keyword_re = re.compile(
+            rb'\b(?:' + b'|'.join(re.escape(k.encode()) for k in keywords) + rb')\b',
+            re.IGNORECASE
+        ) if keywords else None
+        
     def load_keywords(self) -> List[str]:
         """Load sensitive keywords to look for"""
         try:
@@ -24,92 +73,94 @@ class JSAnalyzer:
                 'aws_key', 'aws_secret', 's3_bucket', 'github_token'
             ]
     
-    def download_file(self, url: str) -> str:
-        """Download JS file content"""
+    def download_file(self, url: str) -> bytes:
+        """Download raw JS file content"""
         try:
             response = requests.get(url, timeout=30, verify=True)
             response.raise_for_status()
-            return response.text
+            return response.content
         except Exception as e:
             print(f"Error downloading {url}: {e}")
-            return ""
+            return b""
+    
+    def load_cached_file(self, file_hash: str) -> bytes:
+        """Read a JS body already downloaded by the extractor, if cached"""
+        try:
+            with open(f"{JS_CACHE_DIR}/{file_hash}.js", 'rb') as f:
+                return f.read()
+        except OSError:
+            return b""
     
-    def analyze_content(self, content: str) -> Dict:
-        """Analyze JS content for sensitive information"""
+    def analyze_content(self, content: bytes) -> Dict:
+        """Analyze raw JS content for sensitive information"""
         findings = {
             'sensitive_patterns': [],
             'endpoints': [],
             'comments': [],
             'file_size': len(content),
-            'line_count': content.count('\n') + 1
+            'line_count': content.count(b'\n') + 1
         }
         
-        # Look for sensitive patterns
-        for keyword in self.sensitive_keywords:
-            pattern = re.compile(rf'\b{keyword}\b', re.IGNORECASE)
-            matches = pattern.findall(content)
-            if matches:
-                # Get context around matches
-                for match in set(matches):
-                    # Find line numbers
-                    lines = content.split('\n')
-                    for i, line in enumerate(lines):
-                        if match.lower() in line.lower():
-                            # Extract context (2 lines before and after)
-                            start = max(0, i - 2)
-                            end = min(len(lines), i + 3)
-                            context = '\n'.join(lines[start:end])
-                            
-                            findings['sensitive_patterns'].append({
-                                'keyword': match,
-                                'line': i + 1,
-                                'context': context[:500]  # Limit context length
-                            })
-                            break
+        lines = content.split(b'\n')
+        
+        # Offset of the first character of each line, for match -> line lookup
+        line_starts = [0]
+        append = line_starts.append
+        pos = 0
+        for ln in lines:
+            pos += len(ln) + 1
+            append(pos)
         
-        # Look for API endpoints
-        endpoint_patterns = [
-            r'["\'](https?://[^"\']+?/api/[^"\']*?)["\']',
-            r'["\'](/api/[^"\']*?)["\']',
-            r'fetch\(["\']([^"\']+?)["\']',
-            r'axios\.(?:get|post|put|delete)\(["\']([^"\']+?)["\']',
-            r'\.ajax\([^)]*?url:\s*["\']([^"\']+?)["\']'
-        ]
+        # Look for sensitive patterns, once per distinct (keyword, line)
+        sensitive = findings['sensitive_patterns']
+        seen = set()
+        for m in self._keyword_re.finditer(content) if self._keyword_re else ():
+            i = bisect.bisect_right(line_starts, m.start()) - 1
+            key = (m.group(0).lower(), i)
+            if key in seen:
+                continue
+            seen.add(key)
+            
+            # Past the cap, only count
+            if len(seen) > MAX_KEYWORD_FINDINGS:
+                continue
+            
+            # Extract context (2 lines before and after)
+            context = b'\n'.join(lines[max(0, i - 2):i + 3])
+            
+            sensitive.append({
+                'keyword': _text(m.group(0)),
+                'line': i + 1,
+                'context': _text(context[:500])  # Limit context length
+            })
         
-        for pattern in endpoint_patterns:
-            matches = re.findall(pattern, content)
+        for pattern in _ENDPOINT_RES:
+            matches = pattern.findall(content)
             for match in matches:
                 if match and len(match) < 200:  # Sanity check
-                    findings['endpoints'].append(match)
+                    findings['endpoints'].append(_text(match))
         
-        # Extract comments (potential information disclosure)
-        comment_patterns = [
-            r'//\s*(.*?)$',  # Single line comments
-            r'/\*\*(.*?)\*/',  # JSDoc comments
-            r'/\*!(.*?)\*/',  # Important comments
-        ]
-        
-        for pattern in comment_patterns:
-            matches = re.findall(pattern, content, re.DOTALL | re.MULTILINE)
+        for pattern in _COMMENT_RES:
+            matches = pattern.findall(content)
             for match in matches:
-                clean_comment = ' '.join(match.strip().split())
+                clean_comment = b' '.join(match.split())
                 if len(clean_comment) > 20:  # Only significant comments
-                    findings['comments'].append(clean_comment[:200])  # Limit length
+                    findings['comments'].append(_text(clean_comment[:200]))  # Limit length
         
-        # Look for hardcoded credentials patterns
-        credential_patterns = [
-            r'["\'](eyJ[A-Za-z0-9_-]+\.eyJ[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+)["\']',  # JWT
-            r'["\'](AKIA[0-9A-Z]{16})["\']',  # AWS Access Key
-            r'["\']([0-9a-f]{40})["\']',  # SHA1 hash
-            r'["\']([0-9a-f]{64})["\']',  # SHA256 hash
-        ]
-        
-        for pattern in credential_patterns:
-            matches = re.findall(pattern, content)
-            findings['sensitive_patterns'].extend([
-                {'keyword': 'POTENTIAL_CREDENTIAL', 'pattern': match[:50]}
-                for match in matches
+        credential_count = 0
+        for pattern in _CREDENTIAL_RES:
+            matches = pattern.findall(content)
+            sensitive.extend([
+                {'keyword': 'POTENTIAL_CREDENTIAL', 'pattern': _text(match[:50])}
+                for match in matches[:max(0, MAX_CREDENTIAL_FINDINGS - credential_count)]
             ])
+            credential_count += len(matches)
+        
+        # Totals over the whole file, whatever the caps dropped
+        findings['keyword_count'] = len({keyword for keyword, _ in seen})
+        findings['credential_count'] = credential_count
+        findings['sensitive_pattern_total'] = len(seen) + credential_count
+        findings['truncated'] = findings['sensitive_pattern_total'] > len(sensitive)
         
         return findings
     
@@ -117,14 +168,19 @@ class JSAnalyzer:
         """Generate summary of findings"""
         risk_level = "LOW"
         
-        if len(findings['sensitive_patterns']) > 5:
+        # Risk counts distinct keywords (plus each credential match), not
+        # every line a keyword appears on
+        risk_count = findings['keyword_count'] + findings['credential_count']
+        
+        if risk_count > 5:
             risk_level = "HIGH"
-        elif len(findings['sensitive_patterns']) > 2:
+        elif risk_count > 2:
             risk_level = "MEDIUM"
         
         return {
             'risk_level': risk_level,
-            'sensitive_pattern_count': len(findings['sensitive_patterns']),
+            'sensitive_pattern_count': findings['sensitive_pattern_total'],
+            'truncated': findings['truncated'],
             'endpoint_count': len(findings['endpoints']),
             'comment_count': len(findings['comments']),
             'file_size': findings['file_size'],
@@ -132,17 +188,21 @@ class JSAnalyzer:
         }
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: analyze_js.py <js_file_url>")
+    if len(sys.argv) not in (2, 3):
+        print("Usage: analyze_js.py <js_file_url> [file_hash]")
         sys.exit(1)
     
     url = sys.argv[1]
+    file_hash = sys.argv[2] if len(sys.argv) == 3 else None
     analyzer = JSAnalyzer()
     
-    print(f"Analyzing: {url}")
+    # Progress goes to stderr so stdout is only the JSON result
+    print(f"Analyzing: {url}", file=sys.stderr)
     
-    # Download file
-    content = analyzer.download_file(url)
+    # Reuse the body fetched during extraction, else download file
+    content = analyzer.load_cached_file(file_hash) if file_hash else b""
+    if not content:
+        content = analyzer.download_file(url)
     if not content:
         print("Failed to download file")
         sys.exit(1)
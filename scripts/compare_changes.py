@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
 
-import json
 import os
 import sys
+import heapq
 from datetime import datetime
 from typing import Dict, List, Optional
 import difflib
+from json_compat import dumps, loads
 
 class ChangeDetector:
     def __init__(self, domain: str):
@@ -17,24 +18,21 @@ class ChangeDetector:
         if not os.path.exists(self.snapshot_dir):
             return None
         
-        snapshots = [f for f in os.listdir(self.snapshot_dir) 
-                    if f.startswith('snapshot_') and f.endswith('.json')]
+        # Only the two newest names are needed (timestamps sort lexically)
+        snapshots = heapq.nlargest(2, (
+            entry.name for entry in os.scandir(self.snapshot_dir)
+            if entry.name.startswith('snapshot_') and entry.name.endswith('.json')
+        ))
         
         if not snapshots:
             return None
         
-        # Sort by timestamp (newest first)
-        snapshots.sort(reverse=True)
-        
-        # Get the second latest for comparison
-        if len(snapshots) > 1:
-            latest_file = os.path.join(self.snapshot_dir, snapshots[1])
-        else:
-            latest_file = os.path.join(self.snapshot_dir, snapshots[0])
+        # Get the second latest for comparison (or the only one)
+        latest_file = os.path.join(self.snapshot_dir, snapshots[-1])
         
         try:
-            with open(latest_file, 'r') as f:
-                return json.load(f)
+            with open(latest_file, 'rb') as f:
+                return loads(f.read())
         except:
             return None
     
@@ -43,20 +41,19 @@ class ChangeDetector:
         old_by_url = {f['url']: f for f in old_files}
         new_by_url = {f['url']: f for f in new_files}
         
+        # Membership via the dicts; iterating them keeps snapshot order
         added = [f for url, f in new_by_url.items() if url not in old_by_url]
         removed = [f for url, f in old_by_url.items() if url not in new_by_url]
-        changed = []
-        
-        for url, new_file in new_by_url.items():
-            if url in old_by_url:
-                old_file = old_by_url[url]
-                if old_file['hash'] != new_file['hash']:
-                    changed.append({
-                        'url': url,
-                        'old_hash': old_file['hash'],
-                        'new_hash': new_file['hash'],
-                        'filename': new_file['filename']
-                    })
+        changed = [
+            {
+                'url': url,
+                'old_hash': old_by_url[url]['hash'],
+                'new_hash': f['hash'],
+                'filename': f['filename']
+            }
+            for url, f in new_by_url.items()
+            if url in old_by_url and old_by_url[url]['hash'] != f['hash']
+        ]
         
         return {
             'added': added,
@@ -117,7 +114,7 @@ def main():
         'hash_changed': True  # We know this from the API check
     }
     
-    print(json.dumps(result, indent=2))
+    print(dumps(result, pretty=True).decode())
 
 if __name__ == "__main__":
     main()
@@ -1,14 +1,71 @@
 #!/usr/bin/env python3
 
 import requests
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin, urlparse, urlsplit, urlunsplit, parse_qsl, urlencode
 import re
 import hashlib
 import json
 from bs4 import BeautifulSoup
 import time
-from typing import List, Dict, Set
+from typing import List, Dict, Set, Optional, Tuple
 import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from json_compat import dumps, loads
+
+# lxml is a much faster HTML parser; fall back to the stdlib one without it
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+JS_CACHE_DIR = "/storage/js_cache"  # Downloaded JS bodies, keyed by content hash
+
+MAX_WORKERS = 8  # Concurrent page fetches / JS downloads
+PER_HOST_LIMIT = 4  # Concurrent requests allowed against a single host
+REQUEST_RATE = 10  # Requests per second across all hosts
+
+# BLAKE3 hashes far faster than SHA-256 and the hash is only used for
+# change detection; fall back to SHA-256 when the module is missing
+try:
+    from blake3 import blake3 as new_hash
+    HASH_ALGO = 'blake3'
+except ImportError:
+    new_hash = hashlib.sha256
+    HASH_ALGO = 'sha256'
+
+def normalize_url(url: str) -> str:
+    """Drop the fragment and sort query parameters so equivalent pages compare equal"""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, query, ''))
+
+class TokenBucket:
+    """Thread-safe token bucket used to pace outgoing requests"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Take one token, sleeping until it becomes available"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            
+            # Reserve the token now; go negative and wait if none is left
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        
+        if wait:
+            time.sleep(wait)
 
 class JSExtractor:
     def __init__(self, domain: str):
@@ -19,20 +76,56 @@ class JSExtractor:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
         self.js_files = {}
+        self.snapshot_dir = f"/storage/snapshots/{domain}"
+        
+        # Cached {url: {hash, etag}} from the previous snapshot, for
+        # conditional re-downloads, and URLs last hashed with SHA-256 while
+        # this run uses another algorithm (see get_file_hash)
+        self.known_files = {}
+        self.sha256_urls = set()
+        
+        # Keep enough pooled connections for every worker thread
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=MAX_WORKERS)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
+        # Politeness: global request rate plus a per-host concurrency cap
+        self.rate_limiter = TokenBucket(REQUEST_RATE, REQUEST_RATE)
+        self.host_limits = {}
+        self.host_lock = threading.Lock()
+    
+    @contextmanager
+    def throttle(self, url: str):
+        """Hold a per-host slot (and a rate token) for the duration of a request"""
+        host = urlparse(url).netloc
+        with self.host_lock:
+            limit = self.host_limits.setdefault(host, threading.Semaphore(PER_HOST_LIMIT))
+        
+        with limit:
+            self.rate_limiter.acquire()
+            yield
         
     def get_page_content(self, url: str) -> str:
         """Fetch page content with error handling"""
         try:
-            response = self.session.get(url, timeout=30, verify=True)
+            with self.throttle(url):
+                response = self.session.get(url, timeout=30, verify=True)
             response.raise_for_status()
             return response.text
         except Exception as e:
             print(f"Error fetching {url}: {e}")
             return ""
     
+    def parse_html(self, html: str) -> BeautifulSoup:
+        """Parse HTML once so the tree can be shared by the extractors"""
+        return BeautifulSoup(html, HTML_PARSER)
+    
     def extract_js_from_html(self, html: str, base_url: str) -> Set[str]:
         """Extract JS file URLs from HTML content"""
-        soup = BeautifulSoup(html, 'html.parser')
+        return self.extract_js_from_soup(self.parse_html(html), base_url)
+    
+    def extract_js_from_soup(self, soup: BeautifulSoup, base_url: str) -> Set[str]:
+        """Extract JS file URLs from an already parsed page"""
         js_urls = set()
         
         # Find script tags with src attribute
@@ -63,6 +156,18 @@ class JSExtractor:
         
         return js_urls
     
+    def extract_links_from_soup(self, soup: BeautifulSoup, base_url: str) -> List[str]:
+        """Extract same-domain links to crawl from an already parsed page, in page order"""
+        links = {}  # dict as an insertion-ordered set
+        for link in soup.find_all('a', href=True):
+            full_url = urljoin(base_url, link['href'])
+            
+            # Only follow links within the same domain
+            if self.domain in full_url:
+                links[full_url] = None
+        
+        return list(links)
+    
     def extract_from_response_text(self, text: str, base_url: str) -> Set[str]:
         """Extract JS file patterns from raw response text"""
         js_patterns = [
@@ -88,107 +193,204 @@ class JSExtractor:
         
         return found_urls
     
-    def get_file_hash(self, url: str) -> str:
-        """Get hash of JS file content"""
+    def load_previous_snapshot(self) -> Dict[str, Dict]:
+        """Map URL -> file entry for files in the latest snapshot"""
+        try:
+            snapshots = [entry.name for entry in os.scandir(self.snapshot_dir)
+                         if entry.name.startswith('snapshot_') and entry.name.endswith('.json')]
+        except OSError:
+            return {}
+        
+        if not snapshots:
+            return {}
+        
+        try:
+            with open(os.path.join(self.snapshot_dir, max(snapshots)), 'rb') as f:
+                files = loads(f.read())['files']
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error loading previous snapshot: {e}")
+            return {}
+        
+        return {f['url']: f for f in files if f.get('hash')}
+    
+    def get_file_hash(self, url: str) -> Tuple[str, Optional[str], Optional[str]]:
+        """Get hash of JS file content, its ETag, and a SHA-256 hash for sha256_urls"""
+        # Ask the server to skip the body if the file is unchanged
+        known = self.known_files.get(url)
+        headers = {'If-None-Match': known['etag']} if known else {}
+        
         try:
-            response = self.session.get(url, timeout=30, verify=True)
-            if response.status_code == 200:
-                content = response.text
-                return hashlib.sha256(content.encode()).hexdigest()
+            # Stream raw bytes into the hasher instead of decoding the body
+            with self.throttle(url), \
+                 self.session.get(url, timeout=30, verify=True, stream=True,
+                                  headers=headers) as response:
+                if response.status_code == 304 and known:
+                    return known['hash'], known['etag'], None
+                
+                if response.status_code == 200:
+                    # Keep the body too, so the analyzer can skip a second GET
+                    file_hash = new_hash()
+                    sha256 = hashlib.sha256() if url in self.sha256_urls else None
+                    body = bytearray()
+                    for chunk in response.iter_content(65536):
+                        file_hash.update(chunk)
+                        if sha256:
+                            sha256.update(chunk)
+                        body += chunk
+                    
+                    digest = file_hash.hexdigest()
+                    self.cache_file(digest, body)
+                    return (digest, response.headers.get('ETag'),
+                            sha256.hexdigest() if sha256 else None)
         except Exception as e:
             print(f"Error fetching {url}: {e}")
         
-        return ""
+        return "", None, None
+    
+    def cache_file(self, file_hash: str, body: bytes):
+        """Store a downloaded JS body under its hash (identical files share one entry)"""
+        path = os.path.join(JS_CACHE_DIR, f"{file_hash}.js")
+        if os.path.exists(path):
+            return
+        
+        try:
+            os.makedirs(JS_CACHE_DIR, exist_ok=True)
+            
+            # Write to a private temp file first; concurrent writers of the
+            # same hash then race harmlessly on the final rename
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error caching {file_hash}: {e}")
     
     def crawl_for_js(self, max_pages: int = 10) -> List[Dict]:
         """Crawl the website to find JS files"""
         visited = set()
-        to_visit = [self.base_url]
+        to_visit = deque([self.base_url])
+        enqueued = {self.base_url}  # Everything ever queued, so nothing is queued twice
+        pending_js = {}  # js_url -> (hash future, source page)
         all_js_files = {}
         
-        while to_visit and len(visited) < max_pages:
-            url = to_visit.pop(0)
-            
-            if url in visited:
-                continue
-            
-            print(f"Crawling: {url}")
-            visited.add(url)
+        previous = self.load_previous_snapshot()
+        
+        # Cached hashes are only reusable if computed with the same algorithm
+        # (snapshots predating hash_algo used SHA-256)
+        self.known_files = {url: f for url, f in previous.items()
+                            if f.get('etag') and f.get('hash_algo', 'sha256') == HASH_ALGO}
+        
+        # While moving off SHA-256, also send a SHA-256 hash for those files
+        # so the API can still compare them against the stored hash
+        if HASH_ALGO != 'sha256':
+            self.sha256_urls = {url for url, f in previous.items()
+                                if f.get('hash_algo', 'sha256') == 'sha256'}
+        
+        # Pages are fetched in concurrent batches while JS files are hashed
+        # in a second pool, so downloads overlap with further crawling.
+        # Workers return their results (hashes, ETag) and only read
+        # known_files/sha256_urls;
+        # crawl state is only touched from this thread.
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as page_pool, \
+             ThreadPoolExecutor(max_workers=MAX_WORKERS) as hash_pool:
             
-            try:
-                # Get page content
-                html = self.get_page_content(url)
-                if not html:
-                    continue
-                
-                # Extract JS files from HTML
-                html_js = self.extract_js_from_html(html, url)
-                
-                # Extract JS files from raw text
-                text_js = self.extract_from_response_text(html, url)
-                
-                # Combine all JS files
-                page_js = html_js.union(text_js)
-                
-                # Process each JS file
-                for js_url in page_js:
-                    if js_url not in all_js_files:
-                        file_hash = self.get_file_hash(js_url)
-                        if file_hash:  # Only include files we can access
-                            filename = os.path.basename(urlparse(js_url).path)
-                            if not filename:
-                                filename = js_url.split('/')[-1]
-                            
-                            all_js_files[js_url] = {
-                                'url': js_url,
-                                'filename': filename,
-                                'hash': file_hash,
-                                'source_page': url
-                            }
-                
-                # Extract links for further crawling
-                soup = BeautifulSoup(html, 'html.parser')
-                for link in soup.find_all('a', href=True):
-                    href = link['href']
-                    full_url = urljoin(url, href)
+            while to_visit and len(visited) < max_pages:
+                batch = {}
+                while to_visit and len(visited) < max_pages:
+                    url = to_visit.popleft()
                     
-                    # Only follow links within the same domain
-                    if self.domain in full_url and full_url not in visited:
-                        to_visit.append(full_url)
-                
-                # Be polite
-                time.sleep(1)
+                    print(f"Crawling: {url}")
+                    visited.add(url)
+                    batch[page_pool.submit(self.get_page_content, url)] = url
                 
-            except Exception as e:
-                print(f"Error processing {url}: {e}")
+                # Handle pages in submission order so results are reproducible;
+                # the whole batch is awaited before the next level anyway
+                for future, url in batch.items():
+                    
+                    try:
+                        # Get page content
+                        html = future.result()
+                        if not html:
+                            continue
+                        
+                        soup = self.parse_html(html)
+                        
+                        # Extract JS files from HTML
+                        html_js = self.extract_js_from_soup(soup, url)
+                        
+                        # Extract JS files from raw text
+                        text_js = self.extract_from_response_text(html, url)
+                        
+                        # Combine all JS files
+                        page_js = html_js.union(text_js)
+                        
+                        # Queue each JS file for hashing (sorted: sets have no stable order)
+                        for js_url in sorted(page_js):
+                            if js_url not in pending_js:
+                                pending_js[js_url] = (
+                                    hash_pool.submit(self.get_file_hash, js_url), url
+                                )
+                        
+                        # Extract links for further crawling
+                        for full_url in self.extract_links_from_soup(soup, url):
+                            full_url = normalize_url(full_url)
+                            if full_url not in enqueued:
+                                enqueued.add(full_url)
+                                to_visit.append(full_url)
+                        
+                    except Exception as e:
+                        print(f"Error processing {url}: {e}")
+            
+            # Collect hashes in discovery order
+            for js_url, (future, source_page) in pending_js.items():
+                file_hash, etag, sha256 = future.result()
+                if file_hash:  # Only include files we can access
+                    filename = os.path.basename(urlparse(js_url).path)
+                    if not filename:
+                        filename = js_url.split('/')[-1]
+                    
+                    all_js_files[js_url] = {
+                        'url': js_url,
+                        'filename': filename,
+                        'hash': file_hash,
+                        'hash_algo': HASH_ALGO,
+                        'etag': etag,
+                        'source_page': source_page
+                    }
+                    if sha256:
+                        all_js_files[js_url]['sha256'] = sha256
         
         return list(all_js_files.values())
     
-    def save_snapshot(self, files: List[Dict]):
-        """Save current snapshot of JS files"""
+    def save_snapshot(self, files: List[Dict], pretty: bool = False):
+        """Save current snapshot of JS files (compact unless pretty is set)"""
         timestamp = time.strftime("%Y%m%d_%H%M%S")
-        snapshot_dir = f"/storage/snapshots/{self.domain}"
-        os.makedirs(snapshot_dir, exist_ok=True)
+        os.makedirs(self.snapshot_dir, exist_ok=True)
         
-        snapshot_file = f"{snapshot_dir}/snapshot_{timestamp}.json"
-        with open(snapshot_file, 'w') as f:
-            json.dump({
+        snapshot_file = f"{self.snapshot_dir}/snapshot_{timestamp}.json"
+        with open(snapshot_file, 'wb') as f:
+            f.write(dumps({
                 'domain': self.domain,
                 'timestamp': timestamp,
                 'total_files': len(files),
                 'files': files
-            }, f, indent=2)
+            }, pretty=pretty) + b'\n')
         
         print(f"Snapshot saved: {snapshot_file}")
         return snapshot_file
 
 def main():
     import sys
-    if len(sys.argv) != 2:
-        print("Usage: extract_js.py <domain>")
+    args = sys.argv[1:]
+    pretty = '--pretty' in args
+    if pretty:
+        args.remove('--pretty')
+    
+    if len(args) != 1:
+        print("Usage: extract_js.py <domain> [--pretty]")
         sys.exit(1)
     
-    domain = sys.argv[1]
+    domain = args[0]
     extractor = JSExtractor(domain)
     
     print(f"Extracting JS files from {domain}...")
@@ -197,7 +399,7 @@ def main():
     print(f"Found {len(js_files)} JS files")
     
     # Save snapshot
-    snapshot_path = extractor.save_snapshot(js_files)
+    snapshot_path = extractor.save_snapshot(js_files, pretty=pretty)
     
     # Output for pipeline
     print(json.dumps({
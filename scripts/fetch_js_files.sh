@@ -5,6 +5,8 @@ CONFIG_DIR="../config"
 STORAGE_DIR="../storage"
 LOG_DIR="../logs"
 API_URL="http://localhost:5000"
+JS_CACHE_DIR="/storage/js_cache"  # Bodies cached by extract_js.py for analyze_js.py
+JS_CACHE_MAX_AGE=60  # Minutes; entries are only needed while their domain is processed
 
 # Load configuration
 TARGETS_FILE="$CONFIG_DIR/targets.json"
@@ -18,10 +20,27 @@ mkdir -p "$STORAGE_DIR/diffs"
 TIMESTAMP=$(date +%Y%m%d_%H%M%S)
 LOG_FILE="$LOG_DIR/fetch_$TIMESTAMP.log"
 
+# Analysis/diff output goes through files: it can exceed the argv size limit
+ANALYSIS_FILE=$(mktemp)
+DIFF_FILE=$(mktemp)
+trap 'rm -f "$ANALYSIS_FILE" "$DIFF_FILE"' EXIT
+
 log() {
     echo "[$(date +'%Y-%m-%d %H:%M:%S')] $1" | tee -a "$LOG_FILE"
 }
 
+# Queue an alert with the Slack sender; takes jq --arg/--rawfile name value pairs.
+# If the sender has died (bash unsets SLACK once it is reaped), send this
+# alert with a one-off sender instead of dropping it.
+send_alert() {
+    if [ -n "${SLACK[1]}" ] && jq -cn '$ARGS.named' "$@" 2>/dev/null >&"${SLACK[1]}"; then
+        return 0
+    fi
+    
+    log "Slack sender not running; sending alert directly"
+    jq -cn '$ARGS.named' "$@" | python3 send_to_slack.py --daemon >> "$LOG_FILE" 2>&1
+}
+
 process_domain() {
     local domain=$1
     log "Processing domain: $domain"
@@ -54,6 +73,12 @@ process_domain() {
     
     log "Found $new_count new files and $modified_count modified files"
     
+    # Stored hash uses an algorithm the extractor could not reproduce
+    unverified_count=$(echo "$check_response" | jq '.unverified_files | length')
+    if [ "$unverified_count" -gt 0 ]; then
+        log "Could not compare $unverified_count files (hash algorithm changed); re-baselining them"
+    fi
+    
     # Step 3: Process new files
     if [ "$new_count" -gt 0 ]; then
         log "Processing $new_count new files..."
@@ -63,8 +88,8 @@ process_domain() {
             file_url=$(echo "$file" | jq -r '.url')
             file_hash=$(echo "$file" | jq -r '.hash')
             
-            # Check if we should alert (deduplication)
-            alert_check=$(curl -s -X POST "$API_URL/api/should-alert" \
+            # Check if we should alert (deduplication) and record it atomically
+            alert_check=$(curl -s -X POST "$API_URL/api/try-alert" \
                 -H "Content-Type: application/json" \
                 -d "{\"domain\": \"$domain_name\", \"file_url\": \"$file_url\", \"content_hash\": \"$file_hash\", \"alert_type\": \"new_file\"}")
             
@@ -73,21 +98,16 @@ process_domain() {
             if [ "$should_alert" = "true" ]; then
                 log "New file detected: $file_url"
                 
-                # Download and analyze file
-                analyze_result=$(python3 analyze_js.py "$file_url")
+                # Analyze file (reuses the body cached during extraction)
+                python3 analyze_js.py "$file_url" "$file_hash" > "$ANALYSIS_FILE"
                 
                 # Send to Slack
-                python3 send_to_slack.py \
-                    --domain "$domain_name" \
-                    --file-url "$file_url" \
-                    --file-hash "$file_hash" \
-                    --alert-type "new_file" \
-                    --analysis "$analyze_result"
-                
-                # Record alert
-                curl -s -X POST "$API_URL/api/record-alert" \
-                    -H "Content-Type: application/json" \
-                    -d "{\"domain\": \"$domain_name\", \"file_url\": \"$file_url\", \"alert_type\": \"new_file\", \"content_hash\": \"$file_hash\"}" > /dev/null
+                send_alert \
+                    --arg domain "$domain_name" \
+                    --arg file_url "$file_url" \
+                    --arg file_hash "$file_hash" \
+                    --arg alert_type "new_file" \
+                    --rawfile analysis "$ANALYSIS_FILE"
             fi
         done
     fi
@@ -101,8 +121,8 @@ process_domain() {
             file_url=$(echo "$file" | jq -r '.url')
             file_hash=$(echo "$file" | jq -r '.hash')
             
-            # Check if we should alert
-            alert_check=$(curl -s -X POST "$API_URL/api/should-alert" \
+            # Check if we should alert and record it atomically
+            alert_check=$(curl -s -X POST "$API_URL/api/try-alert" \
                 -H "Content-Type: application/json" \
                 -d "{\"domain\": \"$domain_name\", \"file_url\": \"$file_url\", \"content_hash\": \"$file_hash\", \"alert_type\": \"modified_file\"}")
             
@@ -111,25 +131,20 @@ process_domain() {
             if [ "$should_alert" = "true" ]; then
                 log "Modified file detected: $file_url"
                 
-                # Download and analyze file
-                analyze_result=$(python3 analyze_js.py "$file_url")
+                # Analyze file (reuses the body cached during extraction)
+                python3 analyze_js.py "$file_url" "$file_hash" > "$ANALYSIS_FILE"
                 
                 # Get diff with previous version
-                diff_result=$(python3 compare_changes.py "$domain_name" "$file_url")
+                python3 compare_changes.py "$domain_name" "$file_url" > "$DIFF_FILE"
                 
                 # Send to Slack
-                python3 send_to_slack.py \
-                    --domain "$domain_name" \
-                    --file-url "$file_url" \
-                    --file-hash "$file_hash" \
-                    --alert-type "modified_file" \
-                    --analysis "$analyze_result" \
-                    --diff "$diff_result"
-                
-                # Record alert
-                curl -s -X POST "$API_URL/api/record-alert" \
-                    -H "Content-Type: application/json" \
-                    -d "{\"domain\": \"$domain_name\", \"file_url\": \"$file_url\", \"alert_type\": \"modified_file\", \"content_hash\": \"$file_hash\"}" > /dev/null
+                send_alert \
+                    --arg domain "$domain_name" \
+                    --arg file_url "$file_url" \
+                    --arg file_hash "$file_hash" \
+                    --arg alert_type "modified_file" \
+                    --rawfile analysis "$ANALYSIS_FILE" \
+                    --rawfile diff "$DIFF_FILE"
             fi
         done
     fi
@@ -146,11 +161,24 @@ process_domain() {
 # Main execution
 log "Starting JS file monitoring scan"
 
+# One long-running Slack sender for the whole scan, fed JSON lines by send_alert
+coproc SLACK { python3 send_to_slack.py --daemon >> "$LOG_FILE" 2>&1; }
+SLACK_SENDER_PID=$SLACK_PID  # SLACK_PID is unset when the coprocess exits
+
 for domain in $DOMAINS; do
     process_domain "$domain"
     
+    # Drop cached bodies from earlier domains/scans so the cache stays bounded
+    find "$JS_CACHE_DIR" -type f -mmin +"$JS_CACHE_MAX_AGE" -delete 2>/dev/null
+    
     # Rate limiting between domains
     sleep 5
 done
 
+# Close the sender's input and wait for queued alerts to go out
+if [ -n "${SLACK[1]}" ]; then
+    eval "exec ${SLACK[1]}>&-"
+fi
+wait "$SLACK_SENDER_PID" 2>/dev/null
+
 log "Scan completed successfully"
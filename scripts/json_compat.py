@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""JSON helpers shared by the monitor scripts"""
+
+import json
+
+# orjson is several times faster than the stdlib json module; fall back without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dumps(data, pretty: bool = False) -> bytes:
+    """Serialize data to JSON bytes (indented if pretty is set)"""
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else 0)
+    return json.dumps(data, indent=2 if pretty else None).encode()
+
+def loads(data):
+    """Parse JSON from str or bytes"""
+    return orjson.loads(data) if orjson else json.loads(data)
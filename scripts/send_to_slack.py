@@ -1,76 +1,312 @@
 #!/usr/bin/env python3
 
-import json
-import requests
+import httpx
+import asyncio
 import sys
+import os
 import argparse
-from datetime import datetime
+import functools
+import collections
+import gzip
+import logging
+import time
+from json_compat import dumps, loads
 
-def send_slack_alert(args):
+# Same line format as the fetch_js_files.sh log this usually ends up in.
+# Only this logger is configured: the root logger stays at WARNING so
+# httpx never logs request lines containing the (secret) webhook URL.
+logger = logging.getLogger(__name__)
+_handler = logging.StreamHandler()
+_handler.setFormatter(logging.Formatter('[%(asctime)s] %(message)s', '%Y-%m-%d %H:%M:%S'))
+logger.addHandler(_handler)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', 'config', 'slack_config.json')
+
+# Webhooks all go to one host: keep pooled connections open. Webhook
+# POSTs are not idempotent (a 5xx may arrive after the message was
+# posted), so only retry failed connects (done by the transport before
+# anything is sent) and 429 rate limiting
+_LIMITS = httpx.Limits(max_connections=16, max_keepalive_connections=16)
+_RETRIES = 3
+_BACKOFF_FACTOR = 0.2
+# Fail fast on an unreachable host but give Slack time to answer
+_TIMEOUT = httpx.Timeout(connect=3.0, read=10.0, write=10.0, pool=5.0)
+
+GZIP_MIN_BYTES = 2048  # Smaller payloads aren't worth compressing
+
+# Fan-out limits: Slack allows about one message per second per webhook
+MAX_CONCURRENT_ALERTS = 4
+ALERTS_PER_SECOND = 1.0
+
+def create_client():
+    """Build the pooled HTTP/2 client shared by every alert"""
+    transport = httpx.AsyncHTTPTransport(http2=True, limits=_LIMITS, retries=_RETRIES)
+    return httpx.AsyncClient(transport=transport, timeout=_TIMEOUT)
+
+async def post_with_retry(client, url, **kwargs):
+    """POST, retrying only rate-limited (429) responses"""
+    for attempt in range(_RETRIES + 1):
+        response = await client.post(url, **kwargs)
+        if response.status_code != 429 or attempt == _RETRIES:
+            return response
+        
+        # Honor Slack's Retry-After, else back off exponentially
+        try:
+            delay = float(response.headers['Retry-After'])
+        except (KeyError, ValueError):
+            delay = _BACKOFF_FACTOR * 2 ** attempt
+        await asyncio.sleep(delay)
+
+@functools.lru_cache(maxsize=1)
+def load_config():
+    """Load Slack configuration (read once per process)"""
+    with open(_CONFIG_PATH, 'rb') as f:
+        return loads(f.read())
+
+async def send_slack_alert(args, client):
     """Send alert to Slack"""
     
-    # Load Slack configuration
-    with open('../config/slack_config.json', 'r') as f:
-        config = json.load(f)
+    config = load_config()
+    webhook_url = config.get('webhook_url')
     
-    webhook_url = config['webhook_url']
+    # Bail out before building anything if the alert would not be sent
+    if not webhook_url:
+        logger.info("No webhook configured; skipping")
+        return True
     
-    # Parse analysis if provided
-    analysis = None
-    if args.analysis:
-        try:
-            analysis = json.loads(args.analysis)
-        except:
-            analysis = {'summary': args.analysis}
+    enabled_types = config.get('enabled_alert_types')
+    if enabled_types is not None and args.alert_type not in enabled_types:
+        logger.info("Alert type %s disabled; skipping", args.alert_type)
+        return True
+    
+    analysis = parse_analysis(args.analysis) if args.analysis else None
+    timestamp = current_time()
     
     # Create message based on alert type
-    if args.alert_type == "new_file":
-        message = create_new_file_message(
-            args.domain, args.file_url, args.file_hash, analysis
-        )
-    elif args.alert_type == "modified_file":
-        message = create_modified_file_message(
-            args.domain, args.file_url, args.file_hash, analysis, args.diff
-        )
-    else:
-        message = create_generic_message(
-            args.domain, args.file_url, args.alert_type
-        )
-    
-    # Send to Slack
-    response = requests.post(
-        webhook_url,
-        json=message,
-        headers={'Content-Type': 'application/json'}
+    build = _BUILDERS.get(args.alert_type, _build_generic)
+    message = build(args, analysis, timestamp)
+    
+    # Send to Slack (large analyses compress well; level 1 is cheap)
+    body = dumps(message)
+    headers = {'Content-Type': 'application/json'}
+    if len(body) > GZIP_MIN_BYTES:
+        body = gzip.compress(body, compresslevel=1)
+        headers['Content-Encoding'] = 'gzip'
+    
+    response = await post_with_retry(
+        client, webhook_url,
+        content=body,
+        headers=headers
     )
     
     if response.status_code == 200:
-        print(f"Alert sent successfully for {args.file_url}")
+        logger.info("Alert sent successfully for %s", args.file_url)
         return True
     else:
-        print(f"Failed to send alert: {response.status_code}")
+        logger.error("Failed to send alert: %d", response.status_code)
         return False
 
-def create_new_file_message(domain, file_url, file_hash, analysis):
+def event_to_args(event):
+    """Turn an alert record (same fields as the CLI options) into args"""
+    fields = {'analysis': None, 'diff': None}
+    fields.update({key.replace('-', '_'): value for key, value in event.items()})
+    return argparse.Namespace(**fields)
+
+async def send_alert_safely(args, client):
+    """Send one alert, reporting failures instead of raising"""
+    try:
+        return await send_slack_alert(args, client)
+    except Exception as e:
+        logger.error("Failed to send alert for %s: %s", getattr(args, 'file_url', '?'), e)
+        return False
+
+class RateLimiter:
+    """Spaces out acquisitions to at most `rate` per second (asyncio only)"""
+    
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_slot = 0.0
+    
+    async def acquire(self):
+        # Reserve the next free slot before sleeping so callers queue up in order
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+        await asyncio.sleep(slot - now)
+
+class AlertDispatcher:
+    """Sends alerts over one client, bounded in concurrency and rate"""
+    
+    def __init__(self, client, concurrency=MAX_CONCURRENT_ALERTS, rate=ALERTS_PER_SECOND):
+        # Created inside the running loop (asyncio primitives bind to it on 3.9)
+        self.client = client
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limiter = RateLimiter(rate)
+    
+    async def send(self, args):
+        async with self.semaphore:
+            await self.limiter.acquire()
+            return await send_alert_safely(args, self.client)
+
+async def send_many(args_list):
+    """Send several alerts concurrently over one shared HTTP/2 connection"""
+    async with create_client() as client:
+        dispatcher = AlertDispatcher(client)
+        return await asyncio.gather(*(dispatcher.send(args) for args in args_list))
+
+async def run_daemon(stream):
+    """Send alerts from newline-delimited JSON records until the stream closes"""
+    loop = asyncio.get_running_loop()
+    pending = set()
+    
+    async with create_client() as client:
+        dispatcher = AlertDispatcher(client)
+        
+        while True:
+            # Read in a worker thread so in-flight alerts keep progressing
+            line = await loop.run_in_executor(None, stream.readline)
+            if not line:
+                break
+            if not line.strip():
+                continue
+            
+            try:
+                args = event_to_args(loads(line))
+            except (ValueError, TypeError, AttributeError) as e:
+                logger.warning("Skipping invalid alert record: %s", e)
+                continue
+            
+            task = asyncio.create_task(dispatcher.send(args))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        
+        if pending:
+            await asyncio.gather(*pending)
+
+# Static Block Kit pieces, built once and shared by every message
+_NEW_FILE_HEADER = {
+    "type": "header",
+    "text": {
+        "type": "plain_text",
+        "text": "🚨 NEW JavaScript File Detected",
+        "emoji": True
+    }
+}
+
+_MODIFIED_FILE_HEADER = {
+    "type": "header",
+    "text": {
+        "type": "plain_text",
+        "text": "📝 JavaScript File Modified",
+        "emoji": True
+    }
+}
+
+_CHANGES_DETECTED = {
+    "type": "section",
+    "text": {
+        "type": "mrkdwn",
+        "text": "*Changes Detected:*\nFile content has been modified. Hash changed from previous version."
+    }
+}
+
+_DIVIDER = {"type": "divider"}
+
+_SUMMARY_TMPL = (
+    "*Analysis Summary:*\n"
+    "• Sensitive Patterns: `{sensitive_pattern_count}`\n"
+    "• API Endpoints: `{endpoint_count}`\n"
+    "• File Size: `{file_size:,} bytes`\n"
+    "• Lines: `{line_count}`"
+)
+
+_RISK_COLORS = {
+    'HIGH': '#FF0000',
+    'MEDIUM': '#FFA500',
+    'LOW': '#00FF00',
+    'UNKNOWN': '#808080'
+}
+_UNKNOWN_COLOR = _RISK_COLORS['UNKNOWN']  # Also used for unrecognised levels
+
+@functools.lru_cache(maxsize=1)
+def _format_time(second):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(second))
+
+def current_time():
+    """Formatted local time, shared by every alert built within the same second"""
+    return _format_time(int(time.time()))
+
+def parse_analysis(text):
+    """Parse analyze_js.py output; anything that is not a JSON object is ignored"""
+    # Cheap check first so plain-text analyses skip the parser entirely
+    if text[:1] != '{':
+        return None
+    
+    try:
+        analysis = loads(text)
+    except (ValueError, TypeError):
+        return None
+    
+    return analysis if isinstance(analysis, dict) else None
+
+def analysis_parts(analysis):
+    """Pull out the summary and sensitive findings once per message"""
+    if not analysis:
+        return {}, ()
+    
+    summary = analysis.get('summary') or {}
+    findings = (analysis.get('findings') or {}).get('sensitive_patterns') or ()
+    return summary, findings
+
+@functools.lru_cache(maxsize=1024)
+def _quick_actions_text(domain, file_url):
+    """Quick Actions links for a file (repeat alerts reuse the cached string)"""
+    return (f"*Quick Actions:*\n"
+            f"• <{file_url}|🔗 View File>\n"
+            f"• <https://securityheaders.com/?q={domain}|🔍 Security Headers>\n"
+            f"• <{file_url.replace('https://', 'https://web.archive.org/web/*/')}|📜 View on Archive>")
+
+def create_new_file_message(domain, file_url, file_hash, analysis, timestamp=None):
     """Create Slack message for new file detection"""
+    timestamp = timestamp or current_time()
+    
+    summary, findings = analysis_parts(analysis)
+    risk_level = summary.get('risk_level', 'UNKNOWN')
+    risk_color = _RISK_COLORS.get(risk_level, _UNKNOWN_COLOR)
+    filename = file_url[file_url.rfind('/') + 1:]
     
-    risk_level = analysis.get('summary', {}).get('risk_level', 'UNKNOWN') if analysis else 'UNKNOWN'
-    risk_color = {
-        'HIGH': '#FF0000',
-        'MEDIUM': '#FFA500',
-        'LOW': '#00FF00',
-        'UNKNOWN': '#808080'
-    }.get(risk_level, '#808080')
+    summary_blocks = [{
+        "type": "section",
+        "text": {
+            "type": "mrkdwn",
+            # Missing fields render as 0
+            "text": _SUMMARY_TMPL.format_map(collections.defaultdict(int, summary))
+        }
+    }] if summary else []
+    
+    # Sensitive findings header plus the first 3 findings (zip stops early, no slice)
+    finding_blocks = [{
+        "type": "section",
+        "text": {
+            "type": "mrkdwn",
+            "text": f"*⚠️ Sensitive Patterns Found:*\n"
+                   f"Found `{summary.get('sensitive_pattern_count', len(findings))}` potential sensitive patterns"
+        }
+    }, *({
+        "type": "section",
+        "text": {
+            "type": "mrkdwn",
+            "text": f"*{i}. {finding.get('keyword', 'Pattern')}* (Line {finding.get('line', '?')})\n"
+                   f"```{finding.get('context', '')[:100]}...```"
+        }
+    } for i, finding in zip(range(1, 4), findings))] if findings else []
     
+    # Built in one go so the list is sized once
     blocks = [
-        {
-            "type": "header",
-            "text": {
-                "type": "plain_text",
-                "text": f"🚨 NEW JavaScript File Detected",
-                "emoji": True
-            }
-        },
+        _NEW_FILE_HEADER,
         {
             "type": "section",
             "fields": [
@@ -84,7 +320,7 @@ def create_new_file_message(domain, file_url, file_hash, analysis):
                 },
                 {
                     "type": "mrkdwn",
-                    "text": f"*Time:*\n{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+                    "text": f"*Time:*\n{timestamp}"
                 },
                 {
                     "type": "mrkdwn",
@@ -96,62 +332,22 @@ def create_new_file_message(domain, file_url, file_hash, analysis):
             "type": "section",
             "text": {
                 "type": "mrkdwn",
-                "text": f"*File URL:*\n<{file_url}|{file_url.split('/')[-1][:50]}>"
+                "text": f"*File URL:*\n<{file_url}|{filename[:50]}>"
             }
-        }
-    ]
-    
-    if analysis:
-        summary = analysis.get('summary', {})
-        if summary:
-            blocks.append({
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": f"*Analysis Summary:*\n"
-                           f"• Sensitive Patterns: `{summary.get('sensitive_pattern_count', 0)}`\n"
-                           f"• API Endpoints: `{summary.get('endpoint_count', 0)}`\n"
-                           f"• File Size: `{summary.get('file_size', 0):,} bytes`\n"
-                           f"• Lines: `{summary.get('line_count', 0)}`"
-                }
-            })
-        
-        # Add sensitive findings if any
-        findings = analysis.get('findings', {}).get('sensitive_patterns', [])
-        if findings and len(findings) > 0:
-            blocks.append({
-                "type": "section",
-                "text": {
+        },
+        *summary_blocks,
+        *finding_blocks,
+        _DIVIDER,
+        {
+            "type": "context",
+            "elements": [
+                {
                     "type": "mrkdwn",
-                    "text": f"*⚠️ Sensitive Patterns Found:*\n"
-                           f"Found `{len(findings)}` potential sensitive patterns"
+                    "text": f"🔍 *JS File Monitor* | Detected new file on {domain}"
                 }
-            })
-            
-            # Show first 3 findings
-            for i, finding in enumerate(findings[:3]):
-                blocks.append({
-                    "type": "section",
-                    "text": {
-                        "type": "mrkdwn",
-                        "text": f"*{i+1}. {finding.get('keyword', 'Pattern')}* (Line {finding.get('line', '?')})\n"
-                               f"```{finding.get('context', '')[:100]}...```"
-                    }
-                })
-    
-    blocks.append({
-        "type": "divider"
-    })
-    
-    blocks.append({
-        "type": "context",
-        "elements": [
-            {
-                "type": "mrkdwn",
-                "text": f"🔍 *JS File Monitor* | Detected new file on {domain}"
-            }
-        ]
-    })
+            ]
+        }
+    ]
     
     return {
         "blocks": blocks,
@@ -163,10 +359,7 @@ def create_new_file_message(domain, file_url, file_hash, analysis):
                         "type": "section",
                         "text": {
                             "type": "mrkdwn",
-                            "text": f"*Quick Actions:*\n"
-                                   f"• <{file_url}|🔗 View File>\n"
-                                   f"• <https://securityheaders.com/?q={domain}|🔍 Security Headers>\n"
-                                   f"• <{file_url.replace('https://', 'https://web.archive.org/web/*/')}|📜 View on Archive>"
+                            "text": _quick_actions_text(domain, file_url)
                         }
                     }
                 ]
@@ -174,18 +367,14 @@ def create_new_file_message(domain, file_url, file_hash, analysis):
         ]
     }
 
-def create_modified_file_message(domain, file_url, file_hash, analysis, diff):
+def create_modified_file_message(domain, file_url, file_hash, analysis, diff, timestamp=None):
     """Create Slack message for modified file"""
+    timestamp = timestamp or current_time()
+    summary, _ = analysis_parts(analysis)
+    filename = file_url[file_url.rfind('/') + 1:]
     
     blocks = [
-        {
-            "type": "header",
-            "text": {
-                "type": "plain_text",
-                "text": f"📝 JavaScript File Modified",
-                "emoji": True
-            }
-        },
+        _MODIFIED_FILE_HEADER,
         {
             "type": "section",
             "fields": [
@@ -195,11 +384,11 @@ def create_modified_file_message(domain, file_url, file_hash, analysis, diff):
                 },
                 {
                     "type": "mrkdwn",
-                    "text": f"*File:*\n`{file_url.split('/')[-1][:20]}`"
+                    "text": f"*File:*\n`{filename[:20]}`"
                 },
                 {
                     "type": "mrkdwn",
-                    "text": f"*Time:*\n{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+                    "text": f"*Time:*\n{timestamp}"
                 },
                 {
                     "type": "mrkdwn",
@@ -218,31 +407,21 @@ def create_modified_file_message(domain, file_url, file_hash, analysis, diff):
     
     # Add diff if available
     if diff:
+        blocks.append(_CHANGES_DETECTED)
+    
+    if summary:
         blocks.append({
             "type": "section",
             "text": {
                 "type": "mrkdwn",
-                "text": f"*Changes Detected:*\nFile content has been modified. Hash changed from previous version."
+                "text": f"*Current Analysis:*\n"
+                       f"• Risk: `{summary.get('risk_level', 'UNKNOWN')}`\n"
+                       f"• Patterns: `{summary.get('sensitive_pattern_count', 0)}`\n"
+                       f"• Endpoints: `{summary.get('endpoint_count', 0)}`"
             }
         })
     
-    if analysis:
-        summary = analysis.get('summary', {})
-        if summary:
-            blocks.append({
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": f"*Current Analysis:*\n"
-                           f"• Risk: `{summary.get('risk_level', 'UNKNOWN')}`\n"
-                           f"• Patterns: `{summary.get('sensitive_pattern_count', 0)}`\n"
-                           f"• Endpoints: `{summary.get('endpoint_count', 0)}`"
-                }
-            })
-    
-    blocks.append({
-        "type": "divider"
-    })
+    blocks.append(_DIVIDER)
     
     blocks.append({
         "type": "context",
@@ -256,17 +435,80 @@ def create_modified_file_message(domain, file_url, file_hash, analysis, diff):
     
     return {"blocks": blocks}
 
+def create_generic_message(domain, file_url, alert_type, timestamp=None):
+    """Create Slack message for any other alert type (e.g. removed_file)"""
+    timestamp = timestamp or current_time()
+    label = alert_type.replace('_', ' ').capitalize()
+    
+    return {"blocks": [
+        {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": f"*{label}* on `{domain}` at {timestamp}\n<{file_url}|{file_url}>"
+            }
+        },
+        _DIVIDER,
+        {
+            "type": "context",
+            "elements": [
+                {
+                    "type": "mrkdwn",
+                    "text": f"🔍 *JS File Monitor* | {label} on {domain}"
+                }
+            ]
+        }
+    ]}
+
+def _build_generic(args, analysis, timestamp):
+    """Fallback builder; the generic message ignores the analysis"""
+    return create_generic_message(args.domain, args.file_url, args.alert_type, timestamp)
+
+# Message builder per alert type; anything else gets the generic message
+_BUILDERS = {
+    'new_file': lambda args, analysis, timestamp: create_new_file_message(
+        args.domain, args.file_url, args.file_hash, analysis, timestamp
+    ),
+    'modified_file': lambda args, analysis, timestamp: create_modified_file_message(
+        args.domain, args.file_url, args.file_hash, analysis, args.diff, timestamp
+    ),
+}
+
 def main():
     parser = argparse.ArgumentParser(description='Send JS file alerts to Slack')
-    parser.add_argument('--domain', required=True, help='Domain name')
-    parser.add_argument('--file-url', required=True, help='JS file URL')
-    parser.add_argument('--file-hash', required=True, help='File content hash')
-    parser.add_argument('--alert-type', required=True, choices=['new_file', 'modified_file', 'removed_file'])
+    parser.add_argument('--domain', help='Domain name')
+    parser.add_argument('--file-url', help='JS file URL')
+    parser.add_argument('--file-hash', help='File content hash')
+    parser.add_argument('--alert-type', choices=['new_file', 'modified_file', 'removed_file'])
     parser.add_argument('--analysis', help='JSON analysis results')
     parser.add_argument('--diff', help='Diff information')
+    parser.add_argument('--batch', action='store_true',
+                        help='Read a JSON list of alerts (same fields as the options above) from stdin')
+    parser.add_argument('--events-file',
+                        help='Send every alert in a JSON list stored in this file')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Keep running and send each JSON alert record read from stdin, one per line')
     
     args = parser.parse_args()
-    send_slack_alert(args)
+    
+    if args.daemon:
+        asyncio.run(run_daemon(sys.stdin))
+        return
+    
+    if args.events_file:
+        with open(args.events_file, 'rb') as f:
+            args_list = [event_to_args(event) for event in loads(f.read())]
+    elif args.batch:
+        args_list = [event_to_args(event) for event in loads(sys.stdin.read())]
+    else:
+        missing = [name for name in ('domain', 'file_url', 'file_hash', 'alert_type')
+                   if getattr(args, name) is None]
+        if missing:
+            parser.error('the following arguments are required: ' +
+                         ', '.join('--' + name.replace('_', '-') for name in missing))
+        args_list = [args]
+    
+    asyncio.run(send_many(args_list))
 
 if __name__ == "__main__":
     main()